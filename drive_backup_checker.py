@@ -5,12 +5,20 @@ Porovnáva súbory na lokálnom disku s Google Drive.
 Optimalizované pre veľké objemy dát.
 """
 
+import fnmatch
+import hashlib
+import heapq
 import os
-import json
 import pickle
+import random
+import re
+import sys
+import threading
+import time
 from pathlib import Path
 from typing import Dict, Set, Tuple, Optional
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
 
 from google.auth.transport.requests import Request
@@ -18,11 +26,93 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+import lz4.frame
+import numpy as np
+import orjson
 from tqdm import tqdm
 
 # Ak meníte rozsah, vymažte token.pickle
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+# Google-native dokumenty (Docs, Sheets, ...) nemajú veľkosť - filtrujeme ich na serveri
+NOT_GOOGLE_NATIVE_QUERY = "not mimeType contains 'application/vnd.google-apps.'"
+
+# Polia odpovede: priečinky, súbory (bez mimeType - typ je daný dotazom)
+# a zmiešaný obsah priečinka, kde mimeType rozlišuje priečinky od súborov
+FOLDER_FIELDS = "nextPageToken, files(id, name, parents)"
+FILE_FIELDS = "nextPageToken, files(id, name, size, parents)"
+ITEM_FIELDS = "nextPageToken, files(id, name, mimeType, size, parents)"
+
+# Maximálny počet dotazov v jednej dávke (limit Drive API)
+BATCH_SIZE = 100
+
+# Počet vlákien pre paralelné dotazy na Drive API
+MAX_WORKERS = 8
+
+# Počet opakovaných pokusov pri prekročení rate limitu API alebo chybe servera
+API_RETRY_COUNT = 3
+
+# Počet ciest vypísaných v konzolovom prehľade
+PREVIEW_COUNT = 20
+
+# Súbory zmenené pred týmto rokom sa načítavajú jedným dotazom
+FIRST_SHARD_YEAR = 2010
+
+# Nastavenia z config.py (nepovinný), predvolené hodnoty zodpovedajú config.example.py
+try:
+    import config
+except ImportError:
+    config = None
+
+# Maximálny vek cache v sekundách
+CACHE_MAX_AGE = getattr(config, 'CACHE_MAX_AGE', 86400)
+
+# Ignorované adresáre a súbory pri skenovaní lokálnych súborov
+IGNORE_DIRS = getattr(config, 'IGNORE_DIRS',
+                      ['__pycache__', '.git', '.cache', 'node_modules', '.venv', 'venv'])
+IGNORE_FILES = getattr(config, 'IGNORE_FILES', ['.DS_Store', 'Thumbs.db', '*.tmp', '*.swp'])
+
+_IGNORE_DIRS_SET = frozenset(IGNORE_DIRS)
+
+# Všetky vzory IGNORE_FILES v jednom regexe (na Windows bez ohľadu na veľkosť písmen ako fnmatch)
+_IGNORE_FILES_RE = re.compile(
+    '|'.join(fnmatch.translate(pattern) for pattern in IGNORE_FILES),
+    re.IGNORECASE if os.name == 'nt' else 0
+) if IGNORE_FILES else None
+
+
+def _is_retryable_error(error: Exception) -> bool:
+    """
+    Zistí, či má zmysel dotaz zopakovať - rate limit alebo chyba servera (5xx),
+    rovnako ako execute(num_retries=...).
+    """
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429 or error.resp.status >= 500:
+        return True
+    return error.resp.status == 403 and (
+        b'userRateLimitExceeded' in error.content or b'rateLimitExceeded' in error.content
+    )
+
+
+def _compact_item(item: dict, is_folder: bool) -> dict:
+    """
+    Zmenší metadáta položky z Drive pred uložením.
+    Opakujúce sa reťazce (ID rodičov, názvy priečinkov) sa internujú, takže
+    zdieľajú jeden objekt v pamäti aj v pickle cache. mimeType sa neukladá -
+    typ položky je daný mapou, v ktorej je uložená.
+    """
+    item.pop('mimeType', None)
+    item['id'] = sys.intern(item['id'])
+    if 'parents' in item:
+        item['parents'] = [sys.intern(parent_id) for parent_id in item['parents']]
+    if is_folder:
+        item['name'] = sys.intern(item['name'])
+    return item
+
+
 class DriveBackupChecker:
     def __init__(self, local_root: str, cache_dir: str = ".cache"):
         """
@@ -36,6 +126,9 @@ class DriveBackupChecker:
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
         self.service = None
+        self.creds = None
+        # Každé vlákno potrebuje vlastný service (httplib2 nie je thread-safe)
+        self._thread_local = threading.local()
         
     def authenticate(self):
         """Autentifikácia s Google Drive API."""
@@ -65,54 +158,100 @@ class DriveBackupChecker:
             with open(token_path, 'wb') as token:
                 pickle.dump(creds, token)
         
+        self.creds = creds
         self.service = build('drive', 'v3', credentials=creds)
         print("✓ Úspešne pripojené k Google Drive")
     
-    def scan_local_files(self, use_cache: bool = True) -> Dict[str, dict]:
+    def scan_local_files(self, use_cache: bool = True) -> Dict[str, object]:
         """
         Skenuje lokálne súbory a vytvára index.
         Používa cache pre zrýchlenie pri opakovanom spustení.
         
         Returns:
-            Dictionary: {relatívna_cesta: {size, mtime}}
+            Dictionary: {'paths': [relatívna_cesta], 'sizes': np.int64 pole,
+                         'mtimes': np.float64 pole} - i-ty prvok polí patrí i-tej ceste
         """
-        cache_file = self.cache_dir / 'local_files_cache.json'
+        # Cache je viazaná na koreňový adresár a ignorované vzory
+        cache_file = self._cache_path('local_files_cache', self.local_root,
+                                      sorted(IGNORE_DIRS), sorted(IGNORE_FILES))
         
-        if use_cache and cache_file.exists():
+        if use_cache and self._is_cache_valid(cache_file):
             print("Načítavam lokálne súbory z cache...")
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self._read_cache(cache_file)
         
         print(f"Skenujem lokálne súbory v: {self.local_root}")
-        files_index = {}
-        
-        # Počítame súbory pre progress bar
-        print("Počítam súbory...")
-        total_files = sum(1 for _ in self.local_root.rglob('*') if _.is_file())
+        paths = []
+        sizes = []
+        mtimes = []
+        
+        # Adresáre čítame paralelne, každý podadresár je samostatná úloha
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor, \
+                tqdm(desc="Skenuje lokálne súbory", unit=" súborov") as pbar:
+            futures = {executor.submit(self._scan_directory, str(self.local_root), '')}
+            
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    (dir_paths, dir_sizes, dir_mtimes), subdirs = future.result()
+                    paths.extend(dir_paths)
+                    sizes.extend(dir_sizes)
+                    mtimes.extend(dir_mtimes)
+                    pbar.update(len(dir_paths))
+                    
+                    for dir_path, rel_prefix in subdirs:
+                        futures.add(executor.submit(self._scan_directory, dir_path, rel_prefix))
         
-        with tqdm(total=total_files, desc="Skenuje lokálne súbory") as pbar:
-            for file_path in self.local_root.rglob('*'):
-                if file_path.is_file():
-                    try:
-                        rel_path = str(file_path.relative_to(self.local_root))
-                        stat = file_path.stat()
-                        files_index[rel_path] = {
-                            'size': stat.st_size,
-                            'mtime': stat.st_mtime
-                        }
-                        pbar.update(1)
-                    except (OSError, PermissionError) as e:
-                        print(f"Chyba pri čítaní {file_path}: {e}")
+        files_index = {
+            'paths': paths,
+            'sizes': np.array(sizes, dtype=np.int64),
+            'mtimes': np.array(mtimes, dtype=np.float64)
+        }
         
         # Ulož do cache
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(files_index, f, ensure_ascii=False, indent=2)
+        self._write_cache(cache_file, files_index)
         
-        print(f"✓ Nájdených {len(files_index)} lokálnych súborov")
+        print(f"✓ Nájdených {len(paths)} lokálnych súborov")
         return files_index
     
+    @staticmethod
+    def _scan_directory(dir_path: str, rel_prefix: str) -> Tuple[Tuple[list, list, list], list]:
+        """
+        Prečíta jeden adresár pomocou os.scandir (bez rekurzie).
+        DirEntry.stat() využíva údaje z readdir, kde je to možné.
+        Adresáre z IGNORE_DIRS a súbory zodpovedajúce IGNORE_FILES sa preskočia.
+        
+        Returns:
+            ((cesty, veľkosti, mtimes) súborov, podadresáre [(cesta, rel_prefix)])
+        """
+        paths = []
+        sizes = []
+        mtimes = []
+        subdirs = []
+        
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            # Ignorované adresáre vôbec neprechádzame
+                            if entry.name not in _IGNORE_DIRS_SET:
+                                subdirs.append((entry.path, f"{rel_prefix}{entry.name}/"))
+                        elif entry.is_file(follow_symlinks=False):
+                            if _IGNORE_FILES_RE and _IGNORE_FILES_RE.match(entry.name):
+                                continue
+                            stat = entry.stat(follow_symlinks=False)
+                            paths.append(rel_prefix + entry.name)
+                            sizes.append(stat.st_size)
+                            mtimes.append(stat.st_mtime)
+                    except OSError as e:
+                        print(f"Chyba pri čítaní {entry.path}: {e}")
+        except OSError as e:
+            print(f"Chyba pri čítaní {dir_path}: {e}")
+        
+        return (paths, sizes, mtimes), subdirs
+    
     def scan_drive_files(self, folder_id: Optional[str] = None, 
-                        use_cache: bool = True) -> Dict[str, dict]:
+                        use_cache: bool = True) -> Dict[str, object]:
         """
         Skenuje súbory na Google Drive pomocou API.
         
@@ -121,14 +260,41 @@ class DriveBackupChecker:
             use_cache: Použiť cache
             
         Returns:
-            Dictionary: {relatívna_cesta: {id, size, mimeType}}
+            Dictionary: {'paths': [relatívna_cesta], 'sizes': np.int64 pole, 'ids': [ID súboru]}
+        
+        Pri použití cache sa načítajú iba zmeny od posledného skenovania
+        (Drive Changes API), takže opakované spustenie nevyžaduje úplné skenovanie.
         """
-        cache_file = self.cache_dir / f'drive_files_cache_{folder_id or "root"}.json'
+        cache_file = self._cache_path('drive_files_cache', folder_id or 'root')
         
+        # Súbor sa prepisuje pri každej aktualizácii zmenami, vek cache preto
+        # počítame od posledného úplného skenovania uloženého v cache
         if use_cache and cache_file.exists():
             print("Načítavam Google Drive súbory z cache...")
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            cache = self._read_cache(cache_file)
+            
+            if time.time() - cache.get('scannedAt', 0) > CACHE_MAX_AGE:
+                print("Cache je staršia ako CACHE_MAX_AGE, skenujem Drive odznova...")
+            # Staršie cache bez startPageToken sa nedajú aktualizovať - skenujeme znovu
+            elif 'startPageToken' in cache:
+                if not self.service:
+                    self.authenticate()
+                
+                # V režime priečinka cache obsahuje iba priečinky v skenovanej oblasti
+                known_folders = set(cache['folders'])
+                if self._apply_drive_changes(cache):
+                    complete = not folder_id or self._scan_folders_moved_in(
+                        cache, folder_id, known_folders)
+                    files_index = self._build_drive_index(cache, folder_id)
+                    # Neúplnú cache neukladáme - zmeny sa pri ďalšom spustení načítajú znovu
+                    if complete:
+                        self._write_cache(cache_file, cache)
+                    else:
+                        print("⚠️  Niektoré priečinky sa nepodarilo načítať, cache sa neaktualizuje")
+                    print(f"\n✓ Nájdených {len(files_index['paths'])} súborov na Drive")
+                    return files_index
+                
+                print("Cache nie je možné aktualizovať, skenujem Drive odznova...")
         
         if not self.service:
             self.authenticate()
@@ -143,184 +309,450 @@ class DriveBackupChecker:
                 ).execute()
                 print(f"✓ Priečinok nájdený: '{folder_info['name']}'")
                 
-                if folder_info['mimeType'] != 'application/vnd.google-apps.folder':
+                if folder_info['mimeType'] != FOLDER_MIME_TYPE:
                     print(f"⚠️  POZOR: Toto nie je priečinok, ale {folder_info['mimeType']}")
             except HttpError as error:
                 print(f"❌ Chyba pri prístupe k priečinku: {error}")
                 if error.resp.status == 404:
                     print("   Priečinok neexistuje alebo nemáte k nemu prístup.")
-                return {}
+                return {'paths': [], 'sizes': np.array([], dtype=np.int64), 'ids': []}
         else:
             print("Skenujem celý Google Drive (My Drive)...")
         
-        files_index = {}
-        all_items = []
-        
-        # Rekurzívna funkcia na získanie všetkých súborov z priečinka
-        def get_files_recursive(parent_id: Optional[str]):
-            """Rekurzívne získa všetky súbory z priečinka a podpriečinkov."""
-            # Query pre získanie položiek z priečinka
-            if parent_id:
-                query = f"'{parent_id}' in parents and trashed=false"
-            else:
-                query = "trashed=false"
-            
-            page_token = None
-            items = []
-            
-            while True:
-                try:
-                    results = self.service.files().list(
-                        pageSize=1000,
-                        fields="nextPageToken, files(id, name, mimeType, size, parents)",
-                        pageToken=page_token,
-                        q=query
-                    ).execute()
-                    
-                    page_items = results.get('files', [])
-                    items.extend(page_items)
-                    page_token = results.get('nextPageToken')
-                    
-                    if not page_token:
-                        break
-                        
-                except HttpError as error:
-                    print(f"❌ Chyba API: {error}")
-                    break
-            
-            return items
+        # Token získame ešte pred skenovaním, aby sme nestratili zmeny počas neho
+        scanned_at = time.time()
+        start_page_token = self.service.changes().getStartPageToken().execute()['startPageToken']
         
         # Získame všetky súbory (ak folder_id, len z toho priečinka, inak všetko)
         print("Načítavam zoznam súborov z Drive...")
         
+        # Stránky spracúvame hneď po prijatí priamo do máp ID -> metadáta
+        folders: Dict[str, dict] = {}
+        files: Dict[str, dict] = {}
+        
         if folder_id:
-            # Najprv získame obsah špecifického priečinka
-            direct_items = get_files_recursive(folder_id)
-            print(f"  Priamo v priečinku: {len(direct_items)} položiek")
-            
-            # Počítadlá pre debugging
-            folders_to_scan = []
-            files_count = 0
-            folders_count = 0
-            
-            for item in direct_items:
-                if item['mimeType'] == 'application/vnd.google-apps.folder':
-                    folders_to_scan.append(item)
-                    folders_count += 1
-                else:
-                    files_count += 1
-            
-            print(f"    → {files_count} súborov")
-            print(f"    → {folders_count} podpriečinkov")
-            
-            all_items.extend(direct_items)
-            
-            # Rekurzívne prejdeme všetky podpriečinky
-            if folders_to_scan:
-                print(f"  Skenujem {len(folders_to_scan)} podpriečinkov...")
-                scanned_count = 0
+            complete = self._list_subtrees(
+                [{'id': folder_id, 'name': folder_info['name']}], folders, files)
+        else:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                # Skenujeme celý Drive - priečinky (len pre rekonštrukciu ciest)
+                # a súbory zvlášť, Google-native dokumenty filtruje už server.
+                # Súbory delíme podľa roku zmeny na časti, ktoré sa stránkujú paralelne.
+                folders_future = executor.submit(
+                    self._list_all,
+                    f"mimeType = '{FOLDER_MIME_TYPE}' and trashed=false",
+                    FOLDER_FIELDS,
+                    True
+                )
+                files_futures = [
+                    executor.submit(
+                        self._list_all,
+                        f"trashed=false and mimeType != '{FOLDER_MIME_TYPE}' and "
+                        f"{NOT_GOOGLE_NATIVE_QUERY} and {time_range}",
+                        FILE_FIELDS,
+                        False
+                    )
+                    for time_range in self._modified_time_shards()
+                ]
                 
-                while folders_to_scan:
-                    folder = folders_to_scan.pop(0)
-                    scanned_count += 1
-                    sub_items = get_files_recursive(folder['id'])
-                    
-                    if sub_items:
-                        print(f"    [{scanned_count}/{scanned_count + len(folders_to_scan)}] '{folder['name']}': {len(sub_items)} položiek")
+                complete = True
+                for future in tqdm(as_completed(files_futures), total=len(files_futures),
+                                   desc="Načítavam súbory"):
+                    shard_files, ok = future.result()
+                    files.update(shard_files)
+                    complete = complete and ok
+                folders, ok = folders_future.result()
+                complete = complete and ok
+        
+        print(f"\nCelkom načítaných {len(files)} súborov "
+              f"a {len(folders)} priečinkov z Drive")
+        
+        # Cache obsahuje surové metadáta, aby sa cesty dali po zmenách
+        # (napr. premenovanie priečinka) zrekonštruovať znovu
+        cache = {
+            'scannedAt': scanned_at,
+            'startPageToken': start_page_token,
+            'folders': folders,
+            'files': files
+        }
+        
+        files_index = self._build_drive_index(cache, folder_id)
+        
+        # Štatistika
+        print(f"\n📊 Štatistika skenovania:")
+        print(f"  Súbory spracované:     {len(files)}")
+        print(f"  Priečinky:             {len(folders)}")
+        print(f"  (Google Docs/Sheets/Slides nemajú 'size', do skenovania nie sú zahrnuté)")
+        
+        # Ulož do cache - neúplný výsledok by Changes API už nikdy nedoplnilo
+        if complete:
+            self._write_cache(cache_file, cache)
+        else:
+            print("\n⚠️  Niektoré položky sa nepodarilo načítať, výsledok sa neukladá do cache")
+        
+        print(f"\n✓ Nájdených {len(files_index['paths'])} súborov na Drive")
+        return files_index
+    
+    def _list_subtrees(self, roots: list, folders: Dict[str, dict], files: Dict[str, dict]) -> bool:
+        """
+        Získa celý obsah zadaných priečinkov (rekurzívne) do máp folders a files.
+        Strom prechádzame do šírky po úrovniach. Dotazy pre viac priečinkov
+        posielame v dávkach (batch), dávky jednej úrovne bežia paralelne.
+        
+        Returns:
+            False, ak sa obsah niektorého priečinka nepodarilo načítať
+        """
+        # Fronta (priečinok, pageToken) na spracovanie
+        pending = [(folder, None) for folder in roots]
+        complete = True
+        
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor, \
+                tqdm(desc="Skenujem priečinky", unit=" priečinkov") as pbar:
+            while pending:
+                futures = [
+                    executor.submit(self._list_folders_batch, pending[i:i + BATCH_SIZE])
+                    for i in range(0, len(pending), BATCH_SIZE)
+                ]
+                pending = []
+                
+                for future in as_completed(futures):
+                    sub_folders, sub_files, next_pending, done_count, ok = future.result()
+                    complete = complete and ok
+                    pending.extend(next_pending)
+                    pbar.update(done_count)
                     
-                    for item in sub_items:
-                        if item['mimeType'] == 'application/vnd.google-apps.folder':
-                            folders_to_scan.append(item)
+                    for folder in sub_folders:
+                        folders[folder['id']] = folder
+                        pending.append((folder, None))
+                    for item in sub_files:
+                        files[item['id']] = item
+        
+        return complete
+    
+    def _scan_folders_moved_in(self, cache: dict, root_id: str, known_folders: Set[str]) -> bool:
+        """
+        Doplní obsah priečinkov, ktoré sa zmenami dostali do skenovaného priečinka.
+        Changes API hlási iba presunutý priečinok, nie súbory, ktoré už obsahuje.
+        
+        Returns:
+            False, ak sa obsah niektorého priečinka nepodarilo načítať
+        """
+        folders = cache['folders']
+        get_folder_path = self._folder_path_resolver(folders, root_id)
+        # Samotný skenovaný priečinok sa do cache dostane iba zmenou (napr. premenovaním)
+        new_ids = {
+            fid for fid in folders
+            if fid not in known_folders and fid != root_id and get_folder_path(fid) is not None
+        }
+        # Stačí prejsť najvyššie nové priečinky, podstromy obsahujú aj ostatné
+        roots = [
+            folders[fid] for fid in new_ids
+            if (folders[fid].get('parents') or [None])[0] not in new_ids
+        ]
+        
+        if roots:
+            print(f"Skenujem {len(roots)} nových priečinkov v skenovanej oblasti...")
+            return self._list_subtrees(roots, folders, cache['files'])
+        return True
+    
+    def _get_thread_service(self):
+        """Vráti Drive service pre aktuálne vlákno (httplib2 nie je thread-safe)."""
+        service = getattr(self._thread_local, 'service', None)
+        if service is None:
+            service = build('drive', 'v3', credentials=self.creds)
+            self._thread_local.service = service
+        return service
+    
+    @staticmethod
+    def _modified_time_shards():
+        """Rozdelí súbory podľa roku poslednej zmeny na nezávislé dotazy."""
+        years = range(FIRST_SHARD_YEAR, datetime.now().year + 1)
+        shards = [f"modifiedTime < '{years[0]}-01-01T00:00:00'"]
+        for year in years[:-1]:
+            shards.append(f"modifiedTime >= '{year}-01-01T00:00:00' and "
+                          f"modifiedTime < '{year + 1}-01-01T00:00:00'")
+        shards.append(f"modifiedTime >= '{years[-1]}-01-01T00:00:00'")
+        return shards
+    
+    def _list_all(self, query: str, fields: str, is_folder: bool) -> Tuple[Dict[str, dict], bool]:
+        """
+        Získa všetky položky zodpovedajúce query (so stránkovaním).
+        is_folder určuje, či query vracia priečinky alebo súbory.
+        
+        Returns:
+            ({ID položky: metadáta}, False ak sa nepodarilo načítať všetky stránky)
+        """
+        service = self._get_thread_service()
+        page_token = None
+        items = {}
+        
+        while True:
+            try:
+                results = service.files().list(
+                    pageSize=1000,
+                    fields=fields,
+                    pageToken=page_token,
+                    q=query
+                ).execute(num_retries=API_RETRY_COUNT)
+                
+                page_items = results.get('files', [])
+                for item in page_items:
+                    items[item['id']] = _compact_item(item, is_folder)
+                page_token = results.get('nextPageToken')
+                
+                if not page_token:
+                    break
                     
-                    all_items.extend(sub_items)
+            except HttpError as error:
+                print(f"❌ Chyba API: {error}")
+                return items, False
+        
+        return items, True
+    
+    def _list_folders_batch(self, chunk: list) -> Tuple[list, list, list, int, bool]:
+        """
+        Získa obsah priečinkov v jednej dávke (batch) dotazov.
+        Dotazy odmietnuté kvôli rate limitu alebo chybe servera sa opakujú
+        s exponenciálnym čakaním.
+        
+        Args:
+            chunk: Zoznam (priečinok, pageToken), najviac BATCH_SIZE položiek
             
-            files_to_process = all_items
-        else:
-            # Skenujeme celý Drive
-            files_to_process = get_files_recursive(None)
-        
-        print(f"\nCelkom načítaných {len(files_to_process)} položiek z Drive")
-        
-        # Vytvoríme mapu ID -> item pre rýchle vyhľadávanie
-        id_to_item = {item['id']: item for item in files_to_process}
-        
-        # Funkcia na rekonštrukciu cesty
-        def get_relative_path(item, root_id):
-            """
-            Vytvorí relatívnu cestu k súboru.
-            Ak je root_id zadaný, cesta je relatívna k tomuto priečinku.
-            """
-            path_parts = [item['name']]
-            current_parents = item.get('parents', [])
+        Returns:
+            (priečinky, súbory, ďalšie (priečinok, pageToken) na spracovanie,
+             počet dokončených priečinkov, False ak niektorý dotaz zlyhal)
+        """
+        service = self._get_thread_service()
+        folders = []
+        files = []
+        next_pending = []
+        done_count = 0
+        complete = True
+        
+        for attempt in range(API_RETRY_COUNT + 1):
+            to_retry = []
             
-            # Ideme nahor hierarchiou až po root_id (alebo úplný root)
-            while current_parents:
-                parent_id = current_parents[0]
+            def handle_response(request_id, response, exception):
+                """Spracuje odpoveď jedného dotazu z dávky."""
+                nonlocal done_count, complete
+                folder, page_token = chunk[int(request_id)]
                 
-                # Ak sme dosiahli root priečinok, zastavíme
-                if root_id and parent_id == root_id:
-                    break
+                if exception is not None:
+                    if _is_retryable_error(exception) and attempt < API_RETRY_COUNT:
+                        to_retry.append((folder, page_token))
+                    else:
+                        print(f"❌ Chyba API pri priečinku '{folder['name']}': {exception}")
+                        complete = False
+                    return
                 
-                # Ak rodič je v našom indexe
-                if parent_id in id_to_item:
-                    parent_item = id_to_item[parent_id]
-                    path_parts.insert(0, parent_item['name'])
-                    current_parents = parent_item.get('parents', [])
+                for item in response.get('files', []):
+                    if item.get('mimeType') == FOLDER_MIME_TYPE:
+                        folders.append(_compact_item(item, True))
+                    else:
+                        files.append(_compact_item(item, False))
+                if response.get('nextPageToken'):
+                    next_pending.append((folder, response['nextPageToken']))
                 else:
-                    # Rodič nie je v indexe (je mimo skenovej oblasti)
+                    done_count += 1
+            
+            batch = service.new_batch_http_request(callback=handle_response)
+            for i, (folder, page_token) in enumerate(chunk):
+                batch.add(service.files().list(
+                    pageSize=1000,
+                    fields=ITEM_FIELDS,
+                    pageToken=page_token,
+                    q=f"'{folder['id']}' in parents and trashed=false and "
+                      f"(mimeType = '{FOLDER_MIME_TYPE}' or {NOT_GOOGLE_NATIVE_QUERY})"
+                ), request_id=str(i))
+            try:
+                batch.execute()
+            except HttpError as error:
+                # Chyba celej dávky nastane pred spracovaním odpovedí - opakujeme celú dávku
+                if _is_retryable_error(error) and attempt < API_RETRY_COUNT:
+                    to_retry = chunk
+                else:
+                    print(f"❌ Chyba API: {error}")
+                    complete = False
                     break
             
-            return '/'.join(path_parts)
+            if not to_retry:
+                break
+            
+            chunk = to_retry
+            time.sleep(2 ** attempt + random.random())
         
-        # Spracovanie súborov (nie priečinkov)
-        print("\nSpracovávam cesty súborov...")
+        return folders, files, next_pending, done_count, complete
+    
+    def _apply_drive_changes(self, cache: dict) -> bool:
+        """
+        Aplikuje zmeny z Drive Changes API na metadáta v cache.
         
-        # Počítadlá pre štatistiku
-        skipped_folders = 0
-        skipped_google_docs = 0
-        processed_files = 0
-        
-        with tqdm(total=len(files_to_process), desc="Vytváram index") as pbar:
-            for item in files_to_process:
-                # Preskočíme priečinky
-                if item['mimeType'] == 'application/vnd.google-apps.folder':
-                    skipped_folders += 1
-                    pbar.update(1)
+        Returns:
+            False, ak sa zmeny nepodarilo načítať (napr. neplatný token)
+        """
+        print("Načítavam zmeny na Drive od posledného skenovania...")
+        folders = cache['folders']
+        files = cache['files']
+        page_token = cache['startPageToken']
+        changes_count = 0
+        
+        while page_token:
+            try:
+                results = self.service.changes().list(
+                    pageToken=page_token,
+                    pageSize=1000,
+                    spaces='drive',
+                    fields="nextPageToken, newStartPageToken, "
+                           "changes(changeType, fileId, removed, "
+                           "file(id, name, mimeType, size, parents, trashed))"
+                ).execute()
+            except HttpError as error:
+                print(f"❌ Chyba pri načítaní zmien: {error}")
+                return False
+            
+            for change in results.get('changes', []):
+                # Zmeny celých zdieľaných diskov (changeType 'drive') nemajú fileId
+                if change.get('changeType', 'file') != 'file' or not change.get('fileId'):
                     continue
                 
-                # Preskočíme Google-native dokumenty (Docs, Sheets, atď.)
-                if item['mimeType'].startswith('application/vnd.google-apps.'):
-                    skipped_google_docs += 1
-                    pbar.update(1)
+                file_id = sys.intern(change['fileId'])
+                item = change.get('file')
+                changes_count += 1
+                
+                # Položku vždy odstránime a pridáme ju znovu s aktuálnymi metadátami
+                folders.pop(file_id, None)
+                files.pop(file_id, None)
+                
+                if change.get('removed') or not item or item.pop('trashed', False):
                     continue
                 
-                # Vytvoríme relatívnu cestu
-                rel_path = get_relative_path(item, folder_id)
+                if item['mimeType'] == FOLDER_MIME_TYPE:
+                    folders[file_id] = _compact_item(item, True)
+                elif not item['mimeType'].startswith('application/vnd.google-apps.'):
+                    files[file_id] = _compact_item(item, False)
+            
+            if 'newStartPageToken' in results:
+                cache['startPageToken'] = results['newStartPageToken']
+            page_token = results.get('nextPageToken')
+        
+        print(f"✓ Spracovaných {changes_count} zmien")
+        return True
+    
+    @staticmethod
+    def _folder_path_resolver(folders: Dict[str, dict], root_id: Optional[str]):
+        """
+        Vráti funkciu, ktorá pre ID priečinka vráti jeho relatívnu cestu
+        (prázdny reťazec pre root, None pre priečinok mimo skenovej oblasti).
+        """
+        # Cache ciest priečinkov: ID priečinka -> relatívna cesta.
+        # Predkovia každého priečinka sa tak prechádzajú iba raz.
+        path_cache: Dict[str, Optional[str]] = {}
+        if root_id:
+            path_cache[root_id] = ''
+        
+        def get_folder_path(parent_id: Optional[str]) -> Optional[str]:
+            """Vráti relatívnu cestu priečinka (prázdny reťazec pre root)."""
+            chain = []
+            # Pri celom Drive je neznámy rodič koreň "My Drive"
+            prefix = None if root_id else ''
+            
+            # Ideme nahor hierarchiou až po root_id, úplný root alebo cache
+            while parent_id:
+                if parent_id in path_cache:
+                    prefix = path_cache[parent_id]
+                    break
                 
-                files_index[rel_path] = {
-                    'id': item['id'],
-                    'size': int(item.get('size', 0)),
-                    'mimeType': item['mimeType']
-                }
-                processed_files += 1
-                pbar.update(1)
+                parent_item = folders.get(parent_id)
+                if parent_item is None:
+                    # Rodič nie je v indexe (je mimo skenovej oblasti)
+                    break
+                
+                chain.append(parent_item)
+                parent_id = (parent_item.get('parents') or [None])[0]
+            
+            # Doplníme cesty prejdených priečinkov zhora nadol
+            for folder in reversed(chain):
+                if prefix is not None:
+                    prefix = f"{prefix}/{folder['name']}" if prefix else folder['name']
+                path_cache[folder['id']] = prefix
+            
+            return prefix
         
-        # Štatistika
-        print(f"\n📊 Štatistika skenovania:")
-        print(f"  Súbory spracované:     {processed_files}")
-        print(f"  Priečinky preskočené:  {skipped_folders}")
-        print(f"  Google Docs preskočené: {skipped_google_docs}")
+        return get_folder_path
+    
+    @staticmethod
+    def _build_drive_index(cache: dict, root_id: Optional[str]) -> Dict[str, object]:
+        """
+        Vytvorí index súborov z metadát Drive uložených v cache.
+        Ak je root_id zadaný, cesty sú relatívne k tomuto priečinku a súbory
+        mimo neho sa vynechajú (a odstránia sa aj z cache).
         
-        if skipped_google_docs > 0:
-            print(f"\n💡 TIP: Google Docs/Sheets/Slides nemajú 'size' a nedajú sa priamo porovnať.")
-            print(f"         Tieto súbory sú preskočené (celkom {skipped_google_docs}).")
+        Returns:
+            Dictionary: {'paths': [relatívna_cesta], 'sizes': np.int64 pole, 'ids': [ID súboru]}
+        """
+        folders = cache['folders']
+        get_folder_path = DriveBackupChecker._folder_path_resolver(folders, root_id)
         
-        # Ulož do cache
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(files_index, f, ensure_ascii=False, indent=2)
+        # Pozícia cesty v poliach - pri rovnakej ceste vyhráva posledný súbor
+        positions: Dict[str, int] = {}
+        sizes = []
+        ids = []
+        out_of_scope = []
         
-        print(f"\n✓ Nájdených {len(files_index)} súborov na Drive")
-        return files_index
+        print("\nSpracovávam cesty súborov...")
+        for item in tqdm(cache['files'].values(), desc="Vytváram index"):
+            parent_path = get_folder_path((item.get('parents') or [None])[0])
+            if parent_path is None:
+                out_of_scope.append(item['id'])
+                continue
+            
+            rel_path = f"{parent_path}/{item['name']}" if parent_path else item['name']
+            size = int(item.get('size', 0))
+            if rel_path in positions:
+                sizes[positions[rel_path]] = size
+                ids[positions[rel_path]] = item['id']
+            else:
+                positions[rel_path] = len(ids)
+                sizes.append(size)
+                ids.append(item['id'])
+        
+        # Zmeny z celého Drive môžu pridať položky mimo skenovaného priečinka
+        if root_id:
+            for file_id in out_of_scope:
+                del cache['files'][file_id]
+            for folder_id in [fid for fid in folders if get_folder_path(fid) is None]:
+                del folders[folder_id]
+        
+        return {
+            'paths': list(positions),
+            'sizes': np.array(sizes, dtype=np.int64),
+            'ids': ids
+        }
+    
+    def _cache_path(self, name: str, *key_parts) -> Path:
+        """
+        Vráti cestu k cache súboru. Názov obsahuje hash vstupov skenovania,
+        takže pri ich zmene sa stará cache jednoducho nepoužije.
+        """
+        key = hashlib.sha256('|'.join(map(str, key_parts)).encode('utf-8')).hexdigest()[:16]
+        return self.cache_dir / f'{name}.{key}.pkl.lz4'
+    
+    @staticmethod
+    def _is_cache_valid(cache_file: Path) -> bool:
+        """Cache je platná, ak existuje a nie je staršia ako CACHE_MAX_AGE."""
+        return cache_file.exists() and cache_file.stat().st_mtime > time.time() - CACHE_MAX_AGE
+    
+    @staticmethod
+    def _read_cache(cache_file: Path):
+        """Načíta cache súbor (pickle komprimovaný pomocou LZ4)."""
+        with open(cache_file, 'rb') as f:
+            return pickle.loads(lz4.frame.decompress(f.read()))
+    
+    @staticmethod
+    def _write_cache(cache_file: Path, data):
+        """Uloží dáta do cache súboru (pickle komprimovaný pomocou LZ4)."""
+        with open(cache_file, 'wb') as f:
+            f.write(lz4.frame.compress(pickle.dumps(data, protocol=5)))
     
     def compare_files(self, local_files: Dict, drive_files: Dict) -> Dict:
         """
@@ -331,37 +763,47 @@ class DriveBackupChecker:
         """
         print("\nPorovnávam súbory...")
         
-        local_paths = set(local_files.keys())
-        drive_paths = set(drive_files.keys())
+        # Pozícia cesty v poliach indexu
+        local_positions = {path: i for i, path in enumerate(local_files['paths'])}
+        drive_positions = {path: i for i, path in enumerate(drive_files['paths'])}
         
         # Súbory iba lokálne (chýbajú na Drive)
-        only_local = local_paths - drive_paths
+        only_local = local_positions.keys() - drive_positions.keys()
         
         # Súbory iba na Drive (chýbajú lokálne)
-        only_drive = drive_paths - local_paths
+        only_drive = drive_positions.keys() - local_positions.keys()
         
         # Súbory v oboch umiestneniach
-        in_both = local_paths & drive_paths
-        
-        # Kontrola veľkosti pre súbory v oboch umiestneniach
-        size_mismatch = []
-        for path in in_both:
-            local_size = local_files[path]['size']
-            drive_size = drive_files[path]['size']
-            if local_size != drive_size:
-                size_mismatch.append({
-                    'path': path,
-                    'local_size': local_size,
-                    'drive_size': drive_size
-                })
+        in_both = local_positions.keys() & drive_positions.keys()
+        
+        # Kontrola veľkosti pre súbory v oboch umiestneniach - veľkosti
+        # zoradíme do dvoch zarovnaných polí a porovnáme naraz
+        both_paths = list(in_both)
+        local_sizes = local_files['sizes'][np.fromiter(
+            (local_positions[path] for path in both_paths), dtype=np.intp, count=len(both_paths))]
+        drive_sizes = drive_files['sizes'][np.fromiter(
+            (drive_positions[path] for path in both_paths), dtype=np.intp, count=len(both_paths))]
+        
+        size_mismatch = [
+            {
+                'path': both_paths[i],
+                'local_size': int(local_sizes[i]),
+                'drive_size': int(drive_sizes[i])
+            }
+            for i in np.flatnonzero(local_sizes != drive_sizes)
+        ]
+        size_mismatch.sort(key=lambda item: item['path'])
         
+        # Celé množiny netriedime - na výpis stačí prvých PREVIEW_COUNT ciest
         return {
-            'only_local': sorted(only_local),
-            'only_drive': sorted(only_drive),
-            'in_both': sorted(in_both),
+            'only_local': only_local,
+            'only_drive': only_drive,
+            'only_local_preview': heapq.nsmallest(PREVIEW_COUNT, only_local),
+            'only_drive_preview': heapq.nsmallest(PREVIEW_COUNT, only_drive),
+            'in_both': in_both,
             'size_mismatch': size_mismatch,
-            'total_local': len(local_files),
-            'total_drive': len(drive_files)
+            'total_local': len(local_files['paths']),
+            'total_drive': len(drive_files['paths'])
         }
     
     def print_report(self, results: Dict):
@@ -382,19 +824,19 @@ class DriveBackupChecker:
         
         # Detail - súbory iba lokálne
         if results['only_local']:
-            print(f"\n📁 SÚBORY IBA LOKÁLNE (prvých 20):")
-            for path in results['only_local'][:20]:
+            print(f"\n📁 SÚBORY IBA LOKÁLNE (prvých {PREVIEW_COUNT}):")
+            for path in results['only_local_preview']:
                 print(f"  - {path}")
-            if len(results['only_local']) > 20:
-                print(f"  ... a ďalších {len(results['only_local']) - 20}")
+            if len(results['only_local']) > PREVIEW_COUNT:
+                print(f"  ... a ďalších {len(results['only_local']) - PREVIEW_COUNT}")
         
         # Detail - súbory iba na Drive
         if results['only_drive']:
-            print(f"\n☁️  SÚBORY IBA NA DRIVE (prvých 20):")
-            for path in results['only_drive'][:20]:
+            print(f"\n☁️  SÚBORY IBA NA DRIVE (prvých {PREVIEW_COUNT}):")
+            for path in results['only_drive_preview']:
                 print(f"  - {path}")
-            if len(results['only_drive']) > 20:
-                print(f"  ... a ďalších {len(results['only_drive']) - 20}")
+            if len(results['only_drive']) > PREVIEW_COUNT:
+                print(f"  ... a ďalších {len(results['only_drive']) - PREVIEW_COUNT}")
         
         # Detail - rozdielne veľkosti
         if results['size_mismatch']:
@@ -408,11 +850,21 @@ class DriveBackupChecker:
         
         print("\n" + "="*70)
     
-    def save_detailed_report(self, results: Dict, output_file: str = "report.json"):
-        """Uloží detailnú správu do JSON súboru."""
+    def save_detailed_report(self, results: Dict, output_file: str = "report.json",
+                             sort_paths: bool = False):
+        """
+        Uloží detailnú správu do JSON súboru.
+        Zoznamy ciest sa zapisujú priebežne, celý JSON sa v pamäti nevytvára.
+        
+        Args:
+            results: Výsledky z compare_files
+            output_file: Názov výstupného súboru
+            sort_paths: Zoradiť zoznamy ciest (pri veľkom počte súborov pomalé)
+        """
         output_path = self.cache_dir / output_file
+        order = sorted if sort_paths else iter
         
-        report = {
+        header = {
             'timestamp': datetime.now().isoformat(),
             'local_root': str(self.local_root),
             'statistics': {
@@ -422,23 +874,40 @@ class DriveBackupChecker:
                 'only_local': len(results['only_local']),
                 'only_drive': len(results['only_drive']),
                 'size_mismatch': len(results['size_mismatch'])
-            },
-            'details': {
-                'only_local': results['only_local'],
-                'only_drive': results['only_drive'],
-                'size_mismatch': results['size_mismatch']
             }
         }
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(report, f, ensure_ascii=False, indent=2)
+        details = [
+            ('only_local', order(results['only_local'])),
+            ('only_drive', order(results['only_drive'])),
+            ('size_mismatch', results['size_mismatch'])
+        ]
+        
+        with open(output_path, 'wb') as f:
+            # Hlavička bez uzatváracej zátvorky, za ňou pokračuje "details"
+            f.write(orjson.dumps(header, option=orjson.OPT_INDENT_2)[:-2])
+            f.write(b',\n  "details": {')
+            
+            for i, (key, values) in enumerate(details):
+                f.write(b',\n    ' if i else b'\n    ')
+                f.write(orjson.dumps(key) + b': [')
+                
+                empty = True
+                for value in values:
+                    f.write(b'\n      ' if empty else b',\n      ')
+                    f.write(orjson.dumps(value))
+                    empty = False
+                f.write(b']' if empty else b'\n    ]')
+            
+            f.write(b'\n  }\n}\n')
         
         print(f"\n✓ Detailná správa uložená do: {output_path}")
     
     def clear_cache(self):
         """Vymaže cache súbory."""
-        for cache_file in self.cache_dir.glob('*_cache.json'):
-            cache_file.unlink()
+        # Mažeme aj JSON cache zo starších verzií
+        for pattern in ('*_cache.*.pkl.lz4', '*_cache*.json'):
+            for cache_file in self.cache_dir.glob(pattern):
+                cache_file.unlink()
         print("✓ Cache vymazaná")
 
 
@@ -485,6 +954,12 @@ Príklady použitia:
         help='Názov výstupného súboru so správou (default: report.json)'
     )
     
+    parser.add_argument(
+        '--sort-report',
+        action='store_true',
+        help='Zoradiť cesty v detailnej správe podľa abecedy'
+    )
+    
     args = parser.parse_args()
     
     # Validácia lokálnej cesty
@@ -523,7 +998,7 @@ Príklady použitia:
         
         # Výstup
         checker.print_report(results)
-        checker.save_detailed_report(results, args.output)
+        checker.save_detailed_report(results, args.output, sort_paths=args.sort_report)
         
         return 0
         